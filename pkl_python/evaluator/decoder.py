@@ -85,7 +85,7 @@ class Decoder:
             raise ValueError(f"encountered unknown object code: {code}")
 
     def decode_object(
-        self, name: str, rest: List[Code]
+        self, name: str, module_uri: str, rest: List[Code]
     ) -> Dict[str, Any]:
         out = {}
         for entry in rest:
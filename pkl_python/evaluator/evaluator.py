@@ -1,6 +1,12 @@
-from typing import Any, Dict
+import asyncio
+import inspect
+import itertools
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+from .decoder import Decoder
 from .module_source import ModuleSource
-from urllib.parse import urlparse
 from ..types.incoming import (
     EvaluateResponse,
     ListModules,
@@ -9,53 +15,154 @@ from ..types.incoming import (
     ReadModule,
     ReadResource,
 )
-from ..types.outgoing import Evaluate
 from ..types import codes
+from ..types.errors import EvalError, EvaluatorClosedError
 from ..types.evaluator import Evaluator
 from ..types.evaluator_manager import EvaluatorManagerInterface
+from .reader import ModuleReader, Reader, ResourceReader
+
+
+# Readers are only selected by scheme, which is everything before the first colon of
+# a URI, so there is no need to run the URI through a full URL parser.
+def _scheme_of(uri: str) -> str:
+    idx = uri.find(":")
+    return uri[:idx] if idx > 0 else ""
+
+
+logger = logging.getLogger(__name__)
+
+# How many sources each evaluator keeps pre-packed Evaluate fields for.
+EVALUATE_PREFIX_CACHE_SIZE = 128
+
+
+@lru_cache(maxsize=None)
+def _is_async_op(reader_type: type, op_name: str) -> bool:
+    return inspect.iscoroutinefunction(getattr(reader_type, op_name))
 
 
 class EvaluatorImpl(Evaluator):
     def __init__(self, evaluator_id: int, manager: EvaluatorManagerInterface):
         self.evaluator_id = evaluator_id
         self.manager = manager
-        self.pending_requests = {}
-        self.closed = False
+        self.pending_requests: Dict[int, asyncio.Future] = {}
+        self._closed = False
         self.resource_readers = []
         self.module_readers = []
-        self.rand_state = evaluator_id
+        self._next_request_id = itertools.count(1).__next__
+        # Results are msgpack-encoded Pkl values, which need decoding on top of the
+        # plain msgpack the manager's stream unpacker handles.
+        self.decoder = Decoder()
+        # owns_manager closes the manager along with this evaluator, for evaluators
+        # that were given a manager of their own.
+        self.owns_manager = False
+        # (module uri, module text) -> (entry count, packed map entries) for the fields
+        # of an Evaluate request that don't change between evaluations of a source,
+        # for the most recently evaluated sources.
+        self._evaluate_prefix_cache: OrderedDict[
+            Tuple[str, Optional[str]], Tuple[int, bytes]
+        ] = OrderedDict()
+
+    @property
+    def resource_readers(self) -> List[ResourceReader]:
+        return self._resource_readers
+
+    @resource_readers.setter
+    def resource_readers(self, readers: List[ResourceReader]):
+        self._resource_readers = list(readers)
+        self._resource_readers_by_scheme = {r.scheme: r for r in self._resource_readers}
+
+    @property
+    def module_readers(self) -> List[ModuleReader]:
+        return self._module_readers
+
+    @module_readers.setter
+    def module_readers(self, readers: List[ModuleReader]):
+        self._module_readers = list(readers)
+        self._module_readers_by_scheme = {r.scheme: r for r in self._module_readers}
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
 
     def close(self):
-        self.closed = True
-        self.manager.close()
+        if self._closed:
+            return
+        self._closed = True
+        for future in self.pending_requests.values():
+            if not future.done():
+                future.set_exception(EvaluatorClosedError())
+        self.pending_requests.clear()
+        if self.owns_manager:
+            self.manager.close()
+        else:
+            self.manager.close_evaluator(self.evaluator_id)
 
     async def evaluate_expression(self, source: "ModuleSource", expr: str) -> Any:
         bytes = await self.evaluate_expression_raw(source, expr)
-        return self.manager.decoder.decode(bytes)
+        return self.decoder.decode(bytes)
 
     async def evaluate_expression_raw(self, source: "ModuleSource", expr: str) -> bytes:
         if self.closed:
-            raise Exception("evaluator is closed")
-
-        evaluate = Evaluate(
-            request_id=self.random_int63(),
-            evaluator_id=self.evaluator_id,
-            module_uri=source.uri.to_string(),
-            code=codes.Evaluate,
-            expr=expr,
-            module_text=source.contents,
-        )
+            raise EvaluatorClosedError()
 
-        self.pending_requests[evaluate.request_id] = evaluate
+        request_id = self._next_request_id()
+        future = asyncio.get_running_loop().create_future()
+        self.pending_requests[request_id] = future
 
-        await self.manager.send(evaluate)
+        try:
+            await self.manager.send_packed(
+                *self._pack_evaluate(request_id, source, expr)
+            )
+        except Exception:
+            del self.pending_requests[request_id]
+            raise
 
-        resp = await self.pending_requests[evaluate.request_id]
+        resp = await future
         if resp.error:
-            raise Exception(resp.error)
+            raise EvalError(resp.error)
 
         return resp.result
 
+    def _pack_evaluate(
+        self, request_id: int, source: "ModuleSource", expr: Optional[str]
+    ) -> List[bytes]:
+        """
+        Packs an Evaluate message as a list of buffers to be written back to back,
+        reusing the already-packed evaluatorId, moduleUri and moduleText entries for
+        sources this evaluator has seen before.
+        """
+        packer = self.manager.encoder
+        key = (source.uri, source.contents)
+        cache = self._evaluate_prefix_cache
+        prefix = cache.get(key)
+        if prefix is not None:
+            cache.move_to_end(key)
+        else:
+            entries = [
+                packer.pack("evaluatorId"),
+                packer.pack(self.evaluator_id),
+                packer.pack("moduleUri"),
+                packer.pack(source.uri),
+            ]
+            if source.contents is not None:
+                entries += [packer.pack("moduleText"), packer.pack(source.contents)]
+            prefix = (len(entries) // 2, b"".join(entries))
+            cache[key] = prefix
+            if len(cache) > EVALUATE_PREFIX_CACHE_SIZE:
+                cache.popitem(last=False)
+
+        count, packed_entries = prefix
+        tail = [packer.pack("requestId"), packer.pack(request_id)]
+        if expr is not None:
+            tail += [packer.pack("expr"), packer.pack(expr)]
+        return [
+            packer.pack_array_header(2),
+            packer.pack(codes.Evaluate),
+            packer.pack_map_header(count + len(tail) // 2),
+            packed_entries,
+            *tail,
+        ]
+
     async def evaluate_module(self, source: "ModuleSource") -> Any:
         return await self.evaluate_expression(source, "")
 
@@ -71,155 +178,95 @@ class EvaluatorImpl(Evaluator):
         return await self.evaluate_expression(source, "output.value")
 
     def handle_evaluate_response(self, msg: "EvaluateResponse"):
-        pending = self.pending_requests.get(msg.request_id)
+        pending = self.pending_requests.pop(msg.request_id, None)
         if not pending:
             raise Exception(
                 f"received a message for an unknown request id: {msg.request_id}"
             )
-        return
+        if not pending.done():
+            pending.set_result(msg)
 
     def handle_log(self, resp: "Log"):
+        # Level 0 is output of trace(), level 1 is a warning.
         if resp.level == 0:
-            print(resp.message, resp.frame_uri)
+            logger.debug("%s (%s)", resp.message, resp.frame_uri)
         elif resp.level == 1:
-            print(resp.message, resp.frame_uri)
+            logger.warning("%s (%s)", resp.message, resp.frame_uri)
         else:
             raise Exception(f"unknown log level: {resp.level}")
 
     async def handle_read_resource(self, msg: "ReadResource"):
-        response = {
-            "evaluatorId": self.evaluator_id,
-            "requestId": msg.request_id,
-            "code": codes.EvaluateReadResponse,
-        }
-        try:
-            url = urlparse(msg.uri)
-        except Exception as e:
-            await self.manager.send(
-                {
-                    **response,
-                    "error": f"internal error: failed to parse resource url: {e}",
-                }
-            )
-            return
-
-        reader = next(
-            (r for r in self.resource_readers if f"{r.scheme}:" == url.scheme), None
+        await self._dispatch(
+            msg,
+            self._resource_readers_by_scheme,
+            codes.EvaluateReadResponse,
+            "resource",
+            "read",
+            "contents",
         )
 
-        if not reader:
-            await self.manager.send(
-                {
-                    **response,
-                    "error": f"No resource reader found for scheme {url.scheme}",
-                }
-            )
-            return
-
-        try:
-            contents = reader.read(url)
-            await self.manager.send({**response, "contents": contents})
-        except Exception as e:
-            await self.manager.send({**response, "error": str(e)})
-
     async def handle_read_module(self, msg: "ReadModule"):
-        response = {
-            "evaluatorId": self.evaluator_id,
-            "requestId": msg.request_id,
-            "code": codes.EvaluateReadModuleResponse,
-        }
-        try:
-            url = urlparse(msg.uri)
-        except Exception as e:
-            await self.manager.send(
-                {
-                    **response,
-                    "error": f"internal error: failed to parse resource url: {e}",
-                }
-            )
-            return
-
-        reader = next(
-            (r for r in self.module_readers if f"{r.scheme}:" == url.scheme), None
+        await self._dispatch(
+            msg,
+            self._module_readers_by_scheme,
+            codes.EvaluateReadModuleResponse,
+            "module",
+            "read",
+            "contents",
         )
 
-        if not reader:
-            await self.manager.send(
-                {**response, "error": f"No module reader found for scheme {url.scheme}"}
-            )
-            return
-
-        try:
-            contents = reader.read(url)
-            await self.manager.send({**response, "contents": contents})
-        except Exception as e:
-            await self.manager.send({**response, "error": str(e)})
-
     async def handle_list_resources(self, msg: "ListResources"):
-        response = {
-            "evaluatorId": self.evaluator_id,
-            "requestId": msg.request_id,
-            "code": codes.ListResourcesResponse,
-        }
-        try:
-            url = urlparse(msg.uri)
-        except Exception as e:
-            await self.manager.send(
-                {
-                    **response,
-                    "error": f"internal error: failed to parse resource url: {e}",
-                }
-            )
-            return
-
-        reader = next(
-            (r for r in self.resource_readers if f"{r.scheme}:" == url.scheme), None
+        await self._dispatch(
+            msg,
+            self._resource_readers_by_scheme,
+            codes.ListResourcesResponse,
+            "resource",
+            "list_elements",
+            "pathElements",
         )
 
-        if not reader:
-            await self.manager.send(
-                {
-                    **response,
-                    "error": f"No resource reader found for scheme {url.scheme}",
-                }
-            )
-            return
-
-        try:
-            path_elements = reader.list_elements(url)
-            await self.manager.send({**response, "pathElements": path_elements})
-        except Exception as e:
-            await self.manager.send({**response, "error": str(e)})
-
     async def handle_list_modules(self, msg: "ListModules"):
-        response = {
-            "evaluatorId": self.evaluator_id,
-            "requestId": msg.request_id,
-            "code": codes.ListModulesResponse,
-        }
-        try:
-            url = urlparse(msg.uri)
-        except Exception as e:
-            await self.manager.send(
-                {
-                    **response,
-                    "error": f"internal error: failed to parse resource url: {e}",
-                }
-            )
-            return
-
-        reader = next(
-            (r for r in self.module_readers if f"{r.scheme}:" == url.scheme), None
+        await self._dispatch(
+            msg,
+            self._module_readers_by_scheme,
+            codes.ListModulesResponse,
+            "module",
+            "list_elements",
+            "pathElements",
         )
 
+    async def _dispatch(
+        self,
+        msg: "ReadResource | ReadModule | ListResources | ListModules",
+        readers_by_scheme: Dict[str, Reader],
+        response_code: int,
+        reader_kind: str,
+        op_name: str,
+        result_key: str,
+    ):
+        """
+        Resolves the reader for msg.uri, calls op_name on it and sends the result back
+        to Pkl under result_key, or an error if any step fails.
+        """
+        response = {"evaluatorId": self.evaluator_id, "requestId": msg.request_id}
+        scheme = _scheme_of(msg.uri)
+        reader = readers_by_scheme.get(scheme)
+
         if not reader:
-            await self.manager.send(
-                {**response, "error": f"No module reader found for scheme {url.scheme}"}
-            )
+            response["error"] = f"No {reader_kind} reader found for scheme {scheme}"
+            await self.manager.send((response_code, response))
             return
 
         try:
-            path_elements = reader.list_elements(url)
-            await self.manager.send({**response, "pathElements": path_elements})
+            op = getattr(reader, op_name)
+            if _is_async_op(type(reader), op_name):
+                response[result_key] = await op(msg.uri)
+            else:
+                # Run blocking readers off the event loop so that other evaluations
+                # sharing the manager keep making progress.
+                response[result_key] = await asyncio.get_running_loop().run_in_executor(
+                    None, op, msg.uri
+                )
         except Exception as e:
-            await self.manager.send({**response, "error": str(e)})
+            response["error"] = str(e)
+        await self.manager.send((response_code, response))
@@ -1,17 +1,30 @@
 import asyncio
+import dataclasses
+import functools
+import itertools
+import logging
 from .project import load_project_from_evaluator
 from ..types.evaluator_manager import EvaluatorManagerInterface
 from .evaluator import EvaluatorImpl, Evaluator
-from ..types.outgoing import CreateEvaluator, OutgoingMessage, ProjectOrDependency
+from ..types.outgoing import (
+    CreateEvaluator,
+    ModuleReader as ClientModuleReader,
+    ResourceReader as ClientResourceReader,
+    OutgoingMessage,
+    ProjectOrDependency,
+    encode,
+    encode_default,
+)
 import msgpack
 from ..types import codes
+from ..types.errors import EvaluatorManagerClosedError, PklError
 from .evaluator_options import encoded_dependencies, EvaluatorOptions, with_project
 from .preconfigured_options import PreconfiguredOptions
 from ..types.incoming import CreateEvaluatorResponse, decode
+from ..types.project import Project
 import re
 import os
-import subprocess
-from typing import List, Tuple
+from typing import Callable, Coroutine, Dict, List, Set, Tuple
 
 
 def new_evaluator_manager() -> EvaluatorManagerInterface:
@@ -37,49 +50,142 @@ def new_evaluator_manager_with_command(
     return EvaluatorManagerImpl(pkl_command)
 
 
-semver_pattern = re.compile(
-    r"(0|[1-9]\d*)\.(0|[1-9]\d*)\.(0|[1-9]\d*)(?:-((?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*))*))?(?:\+([0-9a-zA-Z-]+(?:\.[0-9a-zA-Z-]+)*))?"
-)
-pkl_version_regex = re.compile(f"Pkl ({semver_pattern.pattern}).*")
+# Kept as source text; it is only compiled as part of _pkl_version_regex().
+semver_pattern = r"(0|[1-9]\d*)\.(0|[1-9]\d*)\.(0|[1-9]\d*)(?:-((?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*))*))?(?:\+([0-9a-zA-Z-]+(?:\.[0-9a-zA-Z-]+)*))?"
+
+
+@functools.cache
+def _pkl_version_regex() -> re.Pattern:
+    # Only compiled once something actually asks for the version. It is only ever
+    # matched at the start of `pkl --version` output, and versions are plain ASCII.
+    return re.compile(f"Pkl ({semver_pattern})", re.ASCII)
+
+
+# Versions reported by `--version` for each Pkl command line, shared between managers
+# so that each command only has to be started once to find out.
+_pkl_versions: Dict[Tuple[str, ...], str] = {}
+
+logger = logging.getLogger(__name__)
+
+# The most the asyncio pipe transport reads from Pkl's stdout at once.
+READ_SIZE = 1 << 18
+
+
+class _StdoutProtocol(asyncio.Protocol):
+    """
+    Hands Pkl's stdout to the manager as soon as the pipe transport reads it, rather
+    than buffering it in a StreamReader for a listener task to read back out.
+    """
+
+    def __init__(self, manager: "EvaluatorManagerImpl"):
+        self.manager = manager
+
+    def data_received(self, data: bytes):
+        self.manager.receive_data(data)
 
 
 class EvaluatorManagerImpl(EvaluatorManagerInterface):
+    # The EvaluatorImpl method handling each message code Pkl sends to an evaluator,
+    # and whether it is a coroutine to be run in the background.
+    _HANDLERS = {
+        codes.EvaluateResponse: ("handle_evaluate_response", False),
+        codes.EvaluateLog: ("handle_log", False),
+        codes.EvaluateRead: ("handle_read_resource", True),
+        codes.EvaluateReadModule: ("handle_read_module", True),
+        codes.ListResourcesRequest: ("handle_list_resources", True),
+        codes.ListModulesRequest: ("handle_list_modules", True),
+    }
+
     def __init__(self, pkl_command: list):
         self.pkl_command = pkl_command
-        self.pending_evaluators = {}
-        self.evaluators = []
-        self.encoder = msgpack.Packer()
-        self.decoder = msgpack.Unpacker()
+        # The command line is resolved once; PKL_EXEC is read when the manager is made.
+        self.program, self.program_args = self.get_command_and_arg_strings()
+        self.pending_evaluators: Dict[int, asyncio.Future] = {}
+        self.next_request_id = itertools.count().__next__
+        self.evaluators: Dict[int, EvaluatorImpl] = {}
+        # evaluator id -> {message code: (bound handler, background)}, bound once when
+        # the evaluator is registered instead of looked up for every message.
+        self.evaluator_handlers: Dict[int, Dict[int, Tuple[Callable, bool]]] = {}
+        self.encoder = msgpack.Packer(default=encode_default)
+        # send() packs whole messages into this packer's own buffer and copies them from
+        # there into the output buffer, instead of materializing each as bytes first.
+        self.message_encoder = msgpack.Packer(default=encode_default, autoreset=False)
+        # The unpacker's buffer starts out big enough for the largest chunk read from
+        # stdout at once, and may grow well past the default 100MiB cap for large
+        # evaluation results.
+        self.decoder = msgpack.Unpacker(
+            raw=False, use_list=False, read_size=READ_SIZE, max_buffer_size=1 << 30
+        )
         self.closed = False
         self.cmd = None
+        self.stdout = None
+        self.version = None
+        self.version_check = None
+        # Outgoing messages are buffered here and written by the writer task, so that
+        # messages sent within the same event loop iteration go out in a single write.
+        self.outbuf = bytearray()
+        self.outbuf_ready = asyncio.Event()
+        # Strong references to running handler tasks, which asyncio only keeps weakly.
+        self.tasks: Set[asyncio.Task] = set()
+        # PklProject path -> (mtime, project) of projects loaded by new_project_evaluator.
+        self.project_cache: Dict[str, Tuple[int, Project]] = {}
 
     async def start(self):
         if self.closed:
-            raise Exception("EvaluatorManager has been closed")
+            raise EvaluatorManagerClosedError()
         if not self.cmd:
-            program, args = self.get_start_command()
-            print(program, args)
-            self.cmd = await asyncio.create_subprocess_exec(
-                program,
-                *args,
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
+            self.loop = asyncio.get_running_loop()
+            logger.debug("starting Pkl server: %s %s", self.program, self.program_args)
+            # Pkl's stdout is a pipe of our own, read through a plain protocol that
+            # feeds the unpacker directly.
+            stdout_read, stdout_write = os.pipe()
+            try:
+                self.cmd = await asyncio.create_subprocess_exec(
+                    self.program,
+                    *self.program_args,
+                    "server",
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=stdout_write,
+                )
+            except BaseException:
+                os.close(stdout_read)
+                raise
+            finally:
+                os.close(stdout_write)
+            self.stdout, _ = await self.loop.connect_read_pipe(
+                lambda: _StdoutProtocol(self), open(stdout_read, "rb", buffering=0)
             )
-            self.listener = asyncio.create_task(self.listen())
+            self.writer = asyncio.create_task(self.flush_writes())
+            self.exit_watcher = asyncio.create_task(self.wait_for_exit())
+            # Look up the version while the server starts, so it is ready by the
+            # time anything asks for it.
+            if self.version_check is None:
+                self.version_check = asyncio.create_task(self.check_version())
+                # Nothing may ever ask for the version, so retrieve a failed check's
+                # exception here rather than have asyncio report it as never retrieved.
+                self.version_check.add_done_callback(
+                    lambda task: task.cancelled() or task.exception()
+                )
+
+    async def wait_for_exit(self):
+        await self.cmd.wait()
+        self.writer.cancel()
+        self.handle_close()
 
     def handle_close(self):
         for future in self.pending_evaluators.values():
-            future.cancel()
+            if not future.done():
+                future.set_exception(PklError("Pkl process exited"))
+        self.pending_evaluators.clear()
         errors = []
-        for ev in self.evaluators.values():
+        for ev in list(self.evaluators.values()):
             try:
                 ev.close()
             except Exception as e:
                 errors.append(e)
         self.closed = True
         if errors:
-            print("errors closing evaluators:", errors)
+            logger.warning("errors closing evaluators: %s", errors)
 
     def get_command_and_arg_strings(self) -> Tuple[str, List[str]]:
         if self.pkl_command:
@@ -91,119 +197,243 @@ class EvaluatorManagerImpl(EvaluatorManagerInterface):
         return "pkl", []
 
     async def send(self, out: "OutgoingMessage"):
-        self.cmd.stdin.write(pack_message(self.encoder, out))
-        await self.cmd.stdin.drain()
+        packer = self.message_encoder
+        try:
+            packer.pack(encode(out))
+            with packer.getbuffer() as message:
+                self.write(message)
+        finally:
+            packer.reset()
 
-    def get_evaluator(self, evaluator_id: int) -> EvaluatorImpl | None:
-        ev = self.evaluators.get(evaluator_id)
-        if not ev:
-            print("Received unknown evaluator id:", evaluator_id)
-        return ev
+    async def send_packed(self, *parts: bytes):
+        """
+        Queues an already msgpack-encoded message to be written to the Pkl process.
+        The message may be given in several parts, which are written back to back.
+        """
+        self.write(*parts)
+
+    def write(self, *parts: bytes):
+        # Gather the parts straight into the output buffer rather than joining them
+        # into a message first.
+        for part in parts:
+            self.outbuf += part
+        self.outbuf_ready.set()
 
-    async def listen(self):
-        while not self.cmd.stdout.at_eof():
-            line = await self.cmd.stdout.readline()
-            stdout_line = await self.cmd.stdout.readline()
-            print(f"stdout: {stdout_line}")
-            self.decoder.feed(line)
+    def close_evaluator(self, evaluator_id: int):
+        """
+        Tells Pkl to release the given evaluator and stops routing messages to it.
+        """
+        self.evaluators.pop(evaluator_id, None)
+        self.evaluator_handlers.pop(evaluator_id, None)
+        if self.cmd and self.cmd.returncode is None:
+            self.write(self._pack_close(evaluator_id))
+
+    def _pack_close(self, evaluator_id: int) -> bytes:
+        # CloseEvaluator only carries the evaluator id, so it is packed directly
+        # rather than going through a message object and encode().
+        return self.encoder.pack((codes.CloseEvaluator, {"evaluatorId": evaluator_id}))
+
+    async def flush_writes(self):
+        while True:
+            await self.outbuf_ready.wait()
+            self.outbuf_ready.clear()
+            # The pipe transport copies anything it can't write straight away, so the
+            # same buffer can be emptied and reused for the next batch.
+            self.cmd.stdin.write(self.outbuf)
+            self.outbuf.clear()
+            await self.cmd.stdin.drain()
+
+    def receive_data(self, data: bytes):
+        # msgpack messages aren't line delimited; the unpacker buffers any partial
+        # message until the rest of it arrives.
+        try:
+            self.decoder.feed(data)
             for item in self.decoder:
-                decoded = decode(item)
-                if decoded.code == codes.NewEvaluatorResponse:
-                    id = str(decoded.request_id)
-                    pending = self.pending_evaluators.get(id)
-                    if not pending:
-                        print(
-                            "warn: received a message for an unknown request id:",
-                            decoded.request_id,
-                        )
-                    else:
-                        pending.set_result(decoded)
-                else:
-                    ev = self.get_evaluator(decoded.evaluator_id)
-                    if not ev:
-                        continue
-                    if decoded.code == codes.EvaluateResponse:
-                        ev.handle_evaluate_response(decoded)
-                    elif decoded.code == codes.EvaluateLog:
-                        ev.handle_log(decoded)
-                    elif decoded.code == codes.EvaluateRead:
-                        ev.handle_read_resource(decoded)
-                    elif decoded.code == codes.EvaluateReadModule:
-                        ev.handle_read_module(decoded)
-                    elif decoded.code == codes.ListResourcesRequest:
-                        ev.handle_list_resources(decoded)
-                    elif decoded.code == codes.ListModulesRequest:
-                        ev.handle_list_modules(decoded)
-
-    def get_start_command(self) -> Tuple[str, List[str]]:
-        cmd, args = self.get_command_and_arg_strings()
-        return cmd, [*args, "server"]
+                self.receive(item)
+        except Exception as e:
+            # Nothing after output that can't be unpacked can be read reliably, so
+            # stop Pkl and let the exit watcher fail everything still pending.
+            logger.error("failed to decode output from Pkl: %r", e)
+            self.close()
+
+    def receive(self, item: Tuple[int, Dict]):
+        # A message that can't be handled shouldn't stop the rest from being read, or
+        # every other pending request would hang waiting for its response.
+        try:
+            self.dispatch(item)
+        except Exception as e:
+            logger.warning("failed to handle message from Pkl: %s", e)
+
+    def dispatch(self, item: Tuple[int, Dict]):
+        decoded = decode(item)
+        if decoded.code == codes.NewEvaluatorResponse:
+            pending = self.pending_evaluators.pop(decoded.request_id, None)
+            if not pending:
+                logger.warning(
+                    "received a message for an unknown request id: %s",
+                    decoded.request_id,
+                )
+            elif not pending.done():
+                pending.set_result(decoded)
+        else:
+            handlers = self.evaluator_handlers.get(decoded.evaluator_id)
+            if not handlers:
+                logger.warning(
+                    "received unknown evaluator id: %s", decoded.evaluator_id
+                )
+                return
+            handler = handlers.get(decoded.code)
+            if not handler:
+                return
+            method, background = handler
+            result = method(decoded)
+            if background:
+                self.spawn(result)
+
+    def spawn(self, coro: Coroutine):
+        """
+        Runs coro in the background, so that slow readers don't hold up messages
+        for other requests.
+        """
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
 
     def close(self):
-        self.cmd.kill()
-
-    def get_version(self) -> str:
-        if self.version:
-            return self.version
-        cmd, args = self.get_command_and_arg_strings()
-        result = subprocess.run([cmd, *args, "--version"], stdout=subprocess.PIPE)
-        version = re.search(self.pkl_version_regex, result.stdout.decode())
+        self.closed = True
+        # Cancelling again would interrupt the check killing its own process.
+        check = self.version_check
+        if check and not check.done() and not check.cancelling():
+            check.cancel()
+        if self.stdout:
+            self.stdout.close()
+        if self.cmd and self.cmd.returncode is None:
+            self.writer.cancel()
+            self.cmd.kill()
+
+    async def get_version(self) -> str:
+        if self.version is None:
+            if self.closed:
+                raise EvaluatorManagerClosedError()
+            if self.version_check is None:
+                self.version_check = asyncio.create_task(self.check_version())
+            try:
+                self.version = await asyncio.shield(self.version_check)
+            except Exception:
+                self.version_check = None
+                raise
+        return self.version
+
+    async def check_version(self) -> str:
+        key = (self.program, *self.program_args)
+        if key in _pkl_versions:
+            return _pkl_versions[key]
+        proc = await asyncio.create_subprocess_exec(
+            *key, "--version", stdout=asyncio.subprocess.PIPE
+        )
+        try:
+            out, _ = await proc.communicate()
+        except asyncio.CancelledError:
+            proc.kill()
+            await proc.wait()
+            raise
+        stdout = out.decode()
+        version = _pkl_version_regex().match(stdout)
         if not version or len(version.groups()) < 2:
-            raise Exception(
-                f"failed to get version information from Pkl. Ran '{' '.join(args)}', and got stdout \"{result.stdout.decode}\""
+            raise PklError(
+                f"failed to get version information from Pkl. Ran '{' '.join(key)} --version', and got stdout \"{stdout}\""
             )
-        self.version = version.group(1)
-        return self.version
+        _pkl_versions[key] = version.group(1)
+        return _pkl_versions[key]
 
-    async def new_evaluator(self, opts):
+    async def new_evaluator(self, opts: "EvaluatorOptions") -> Evaluator:
+        if self.closed:
+            raise EvaluatorManagerClosedError()
         if not self.cmd:
             await self.start()
 
-        request_id = 0
+        request_id = self.next_request_id()
         create_evaluator = CreateEvaluator(
-            request_id=request_id,  # TODO
-            client_resource_readers=opts.resource_readers or [],
-            client_module_readers=opts.module_readers or [],
+            request_id=request_id,
+            client_resource_readers=[
+                ClientResourceReader(
+                    scheme=r.scheme,
+                    has_hierarchical_uris=r.has_hierarchical_uris,
+                    is_globbable=r.is_globbable,
+                )
+                for r in opts.resource_readers or []
+            ],
+            client_module_readers=[
+                ClientModuleReader(
+                    scheme=r.scheme,
+                    has_hierarchical_uris=r.has_hierarchical_uris,
+                    is_globbable=r.is_globbable,
+                    is_local=r.is_local,
+                )
+                for r in opts.module_readers or []
+            ],
+            module_paths=opts.module_paths,
+            env=opts.env,
+            properties=opts.properties,
+            output_format=opts.output_format.value if opts.output_format else None,
+            allowed_modules=opts.allowed_modules,
+            allowed_resources=opts.allowed_resources,
+            root_dir=opts.root_dir,
+            cache_dir=opts.cache_dir,
             code=codes.NewEvaluator,
-            **opts.__dict__,
         )
 
         if opts.project_dir:
             create_evaluator.project = ProjectOrDependency(
-                projectFileUri=f"file://{opts.project_dir}/PklProject",
+                project_file_uri=f"file://{opts.project_dir}/PklProject",
                 dependencies=encoded_dependencies(opts.declared_project_dependencies)
                 if opts.declared_project_dependencies
                 else None,
             )
 
-        future = asyncio.Future()
+        future = self.loop.create_future()
         self.pending_evaluators[request_id] = future
 
         await self.send(create_evaluator)
 
-        stderr_line = await self.cmd.stderr.readline()
-        if stderr_line:  # read from stderr
-            raise Exception(f"Failed to start Evaluator: {stderr_line}")
-
-        response = await future
-        print(response)
-        response = CreateEvaluatorResponse(**response)
+        response: CreateEvaluatorResponse = await future
+        if response.error:
+            raise PklError(f"Failed to start Evaluator: {response.error}")
         ev = EvaluatorImpl(response.evaluator_id, self)
+        ev.resource_readers = opts.resource_readers or []
+        ev.module_readers = opts.module_readers or []
         self.evaluators[response.evaluator_id] = ev
+        self.evaluator_handlers[response.evaluator_id] = {
+            code: (getattr(ev, name), background)
+            for code, (name, background) in self._HANDLERS.items()
+        }
 
         return ev
 
     async def new_project_evaluator(
         self, project_dir: str, opts: "EvaluatorOptions"
     ) -> Evaluator:
-        project_evaluator = self.new_evaluator(PreconfiguredOptions)
-        project = load_project_from_evaluator(
-            project_evaluator, f"{project_dir}/PklProject"
-        )
-
-        return self.new_evaluator({**with_project(project), **opts.__dict__})
-
+        project_file = os.path.abspath(f"{project_dir}/PklProject")
+        mtime = os.stat(project_file).st_mtime_ns
+        cached = self.project_cache.get(project_file)
+        if cached and cached[0] == mtime:
+            project = cached[1]
+        else:
+            project_evaluator = await self.new_evaluator(PreconfiguredOptions)
+            try:
+                project = await load_project_from_evaluator(
+                    project_evaluator, project_file
+                )
+            finally:
+                project_evaluator.close()
+            self.project_cache[project_file] = (mtime, project)
 
-def pack_message(packer: msgpack.Packer, msg: OutgoingMessage) -> bytearray:
-    code, *rest = msg
-    return packer.pack([code, rest])
+        # Options given by the caller take precedence over the project's settings.
+        overrides = {
+            f.name: value
+            for f in dataclasses.fields(opts)
+            if (value := getattr(opts, f.name)) is not None
+        }
+        return await self.new_evaluator(
+            dataclasses.replace(with_project(project), **overrides)
+        )
@@ -22,7 +22,7 @@ class OutputFormat(Enum):
     YAML = "yaml"
 
 
-@dataclass
+@dataclass(slots=True)
 class EvaluatorOptions:
     """
     EvaluatorOptions is the set of options available to control Pkl evaluation.
@@ -142,8 +142,10 @@ def with_project_evaluator_settings(
         return {}
 
 
-def with_project_dependencies(project: Project) -> EvaluatorOptions:
-    return EvaluatorOptions(
-        project_dir=re.sub(r"^file://|/PklProject$", "", project.project_file_uri),
-        declared_project_dependencies=project.dependencies,
-    )
+def with_project_dependencies(
+    project: Project,
+) -> Dict[str, Union[str, ProjectDependencies]]:
+    return {
+        "project_dir": re.sub(r"^file://|/PklProject$", "", project.project_file_uri),
+        "declared_project_dependencies": project.dependencies,
+    }
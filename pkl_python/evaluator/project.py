@@ -1,14 +1,71 @@
-from . import evaluator_exec as exec
+from typing import Any, Dict
 from .module_source import FileSource
 from .preconfigured_options import PreconfiguredOptions
 from ..types.evaluator import Evaluator
-from pkl_python.types.project import Project
+from ..types.outgoing import wire_fields
+from pkl_python.types.project import (
+    Checksums,
+    Project,
+    ProjectDependencies,
+    ProjectEvaluatorSettings,
+    ProjectLocalDependency,
+    ProjectPackage,
+    ProjectRemoteDependency,
+)
 
 
 async def load_project(path: str) -> Project:
-    ev = await exec.new_evaluator(PreconfiguredOptions)
-    return await load_project_from_evaluator(ev, path)
+    # Imported here because evaluator_exec depends on this module through the manager.
+    from . import evaluator_exec
+
+    ev = await evaluator_exec.new_evaluator(PreconfiguredOptions)
+    try:
+        return await load_project_from_evaluator(ev, path)
+    finally:
+        ev.close()
 
 
 async def load_project_from_evaluator(ev: "Evaluator", path: str) -> Project:
-    return await ev.evaluate_output_value(FileSource(path))
+    return project_from_value(await ev.evaluate_output_value(FileSource(path)))
+
+
+def project_from_value(value: Dict[str, Any]) -> Project:
+    """
+    Builds a Project from the decoded output value of a PklProject module.
+    """
+    package = value.get("package")
+    settings = value.get("evaluatorSettings")
+    return Project(
+        project_file_uri=value["projectFileUri"],
+        tests=value.get("tests") or [],
+        dependencies=_dependencies(value.get("dependencies") or {}),
+        package=_from_properties(ProjectPackage, package) if package else None,
+        evaluator_settings=_from_properties(ProjectEvaluatorSettings, settings)
+        if settings
+        else None,
+    )
+
+
+def _dependencies(deps: Dict[str, Dict[str, Any]]) -> ProjectDependencies:
+    local_dependencies = {}
+    remote_dependencies = {}
+    for name, dep in deps.items():
+        # Local dependencies are projects themselves; remote ones only name a package.
+        if "projectFileUri" in dep:
+            local_dependencies[name] = ProjectLocalDependency(
+                package_uri=dep["package"]["uri"],
+                project_file_uri=dep["projectFileUri"],
+                dependencies=_dependencies(dep.get("dependencies") or {}),
+            )
+        else:
+            checksums = dep.get("checksums")
+            remote_dependencies[name] = ProjectRemoteDependency(
+                package_uri=dep["uri"],
+                checksums=Checksums(checksums["sha256"]) if checksums else None,
+            )
+    return ProjectDependencies(local_dependencies, remote_dependencies)
+
+
+def _from_properties(cls: type, properties: Dict[str, Any]) -> Any:
+    # Properties Pkl leaves unset are left as None.
+    return cls(**{name: properties.get(key) for name, key in wire_fields(cls)})
@@ -1,7 +1,9 @@
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from typing import List
 
 
+@dataclass(slots=True)
 class PathElement:
     """
     PathElement is an element within a base URI.
@@ -9,17 +11,18 @@ class PathElement:
     implies URI resource `file:///foo/bar.txt`.
     """
 
-    def __init__(self, name: str, is_directory: bool):
-        # name is the name of the path element.
-        self.name = name
+    # name is the name of the path element.
+    name: str
 
-        # isDirectory tells if the path element is a directory.
-        self.is_directory = is_directory
+    # isDirectory tells if the path element is a directory.
+    is_directory: bool
 
 
 class Reader(ABC):
     """
     Reader is the base implementation shared by a ResourceReader and a ModuleReader.
+    read and list_elements may be implemented as coroutines; plain methods are run in
+    the event loop's default executor so that they don't block it.
     """
 
     def __init__(self, scheme: str, is_globbable: bool, has_hierarchical_uris: bool):
@@ -0,0 +1,28 @@
+class PklError(Exception):
+    """
+    Base class for errors raised while talking to Pkl.
+    """
+
+
+class EvaluatorClosedError(PklError):
+    """
+    Raised when evaluating with an evaluator that has been closed.
+    """
+
+    def __init__(self):
+        super().__init__("evaluator is closed")
+
+
+class EvaluatorManagerClosedError(PklError):
+    """
+    Raised when using an EvaluatorManager that has been closed.
+    """
+
+    def __init__(self):
+        super().__init__("EvaluatorManager has been closed")
+
+
+class EvalError(PklError):
+    """
+    Raised when Pkl reports an error evaluating a module or expression.
+    """
@@ -15,7 +15,10 @@ class EvaluatorManagerInterface(ABC):
         pass
 
     @abstractmethod
-    def get_version(self) -> str:
+    async def get_version(self) -> str:
+        """
+        Returns the version of Pkl backing this evaluator manager.
+        """
         pass
 
     @abstractmethod
@@ -1,54 +1,64 @@
-from typing import Dict, Tuple, Union
-from pydantic import BaseModel, FileUrl
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple, Union
 from . import codes
 
 
-class IncomingMessage(BaseModel):
-    pass
+@dataclass(slots=True)
+class CreateEvaluatorResponse:
+    request_id: int
+    evaluator_id: Optional[int] = None
+    error: Optional[str] = None
+    code: int = codes.NewEvaluatorResponse
 
 
-class CreateEvaluatorResponse(IncomingMessage):
-    evaluatorId: int
-    requestId: int
-    error: int
+@dataclass(slots=True)
+class EvaluateResponse:
+    request_id: int
+    evaluator_id: int
+    result: Optional[bytes] = None
+    error: Optional[str] = None
+    code: int = codes.EvaluateResponse
 
 
-class EvaluateResponse(IncomingMessage):
-    evaluatorId: int
-    requestId: int
-    result: str
-    error: int
+@dataclass(slots=True)
+class ReadResource:
+    request_id: int
+    evaluator_id: int
+    uri: str
+    code: int = codes.EvaluateRead
 
 
-class ReadResource(IncomingMessage):
-    evaluatorId: int
-    requestId: int
-    uri: FileUrl
+@dataclass(slots=True)
+class ReadModule:
+    request_id: int
+    evaluator_id: int
+    uri: str
+    code: int = codes.EvaluateReadModule
 
 
-class ReadModule(IncomingMessage):
-    evaluatorId: int
-    requestId: int
-    uri: FileUrl
-
-
-class Log(IncomingMessage):
-    evaluatorId: int
+@dataclass(slots=True)
+class Log:
+    evaluator_id: int
     level: int
     message: str
-    frameUri: str
+    frame_uri: str
+    code: int = codes.EvaluateLog
 
 
-class ListResources(IncomingMessage):
-    evaluatorId: int
-    requestId: int
-    uri: FileUrl
+@dataclass(slots=True)
+class ListResources:
+    request_id: int
+    evaluator_id: int
+    uri: str
+    code: int = codes.ListResourcesRequest
 
 
-class ListModules(IncomingMessage):
-    evaluatorId: int
-    requestId: int
-    uri: FileUrl
+@dataclass(slots=True)
+class ListModules:
+    request_id: int
+    evaluator_id: int
+    uri: str
+    code: int = codes.ListModulesRequest
 
 
 IncomingMessage = Union[
@@ -61,24 +71,36 @@ IncomingMessage = Union[
     ListModules,
 ]
 
+# Messages come straight from msgpack, so they are mapped onto the message classes
+# without any further validation.
+_DECODERS: Dict[int, Callable[[Dict], "IncomingMessage"]] = {
+    codes.EvaluateResponse: lambda m: EvaluateResponse(
+        m["requestId"], m["evaluatorId"], m.get("result"), m.get("error")
+    ),
+    codes.EvaluateLog: lambda m: Log(
+        m["evaluatorId"], m["level"], m["message"], m["frameUri"]
+    ),
+    codes.NewEvaluatorResponse: lambda m: CreateEvaluatorResponse(
+        m["requestId"], m.get("evaluatorId"), m.get("error")
+    ),
+    codes.EvaluateRead: lambda m: ReadResource(
+        m["requestId"], m["evaluatorId"], m["uri"]
+    ),
+    codes.EvaluateReadModule: lambda m: ReadModule(
+        m["requestId"], m["evaluatorId"], m["uri"]
+    ),
+    codes.ListResourcesRequest: lambda m: ListResources(
+        m["requestId"], m["evaluatorId"], m["uri"]
+    ),
+    codes.ListModulesRequest: lambda m: ListModules(
+        m["requestId"], m["evaluatorId"], m["uri"]
+    ),
+}
+
 
 def decode(incoming: Tuple[int, Dict]) -> "IncomingMessage":
     code, map = incoming
-    value = None
-    if code == codes.EvaluateResponse:
-        value = EvaluateResponse(**map, code=codes.EvaluateResponse)
-    elif code == codes.EvaluateLog:
-        value = Log(**map, code=codes.EvaluateLog)
-    elif code == codes.NewEvaluatorResponse:
-        value = CreateEvaluatorResponse(**map, code=codes.NewEvaluatorResponse)
-    elif code == codes.EvaluateRead:
-        value = ReadResource(**map, code=codes.EvaluateRead)
-    elif code == codes.EvaluateReadModule:
-        value = ReadModule(**map, code=codes.EvaluateReadModule)
-    elif code == codes.ListResourcesRequest:
-        value = ListResources(**map, code=codes.ListResourcesRequest)
-    elif code == codes.ListModulesRequest:
-        value = ListModules(**map, code=codes.ListModulesRequest)
-    else:
+    decoder = _DECODERS.get(code)
+    if decoder is None:
         raise ValueError(f"Unknown code: {code}")
-    return value
+    return decoder(map)
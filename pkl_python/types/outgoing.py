@@ -1,31 +1,32 @@
 from .codes import OutgoingCode
-from pydantic import BaseModel as PydanticBaseModel
-from typing import Dict, List, Union, Optional
+from dataclasses import dataclass, field, fields, is_dataclass
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple, Union, Optional
 
 
-class BaseModel(PydanticBaseModel):
-    class Config:
-        arbitrary_types_allowed = True
-
-
-class ResourceReader(BaseModel):
+@dataclass(slots=True)
+class ResourceReader:
     scheme: str
     has_hierarchical_uris: bool
     is_globbable: bool
 
 
-class ModuleReader(BaseModel):
+@dataclass(slots=True)
+class ModuleReader:
     scheme: str
     has_hierarchical_uris: bool
     is_globbable: bool
     is_local: bool
 
 
-class Checksums(BaseModel):
+@dataclass(slots=True)
+class Checksums:
     checksums: str
 
 
-class ProjectOrDependency(BaseModel):
+@dataclass(slots=True)
+class ProjectOrDependency:
     package_uri: Optional[str] = None
     type: Optional[str] = None
     project_file_uri: Optional[str] = None
@@ -33,7 +34,8 @@ class ProjectOrDependency(BaseModel):
     dependencies: Optional[Dict[str, "ProjectOrDependency"]] = None
 
 
-class CreateEvaluator(BaseModel):
+@dataclass(slots=True)
+class CreateEvaluator:
     request_id: int
     client_resource_readers: Optional[List[ResourceReader]] = None
     client_module_readers: Optional[List[ModuleReader]] = None
@@ -46,48 +48,53 @@ class CreateEvaluator(BaseModel):
     root_dir: Optional[str] = None
     cache_dir: Optional[str] = None
     project: Optional[ProjectOrDependency] = None
-    code: OutgoingCode
+    code: OutgoingCode = field(kw_only=True)
 
 
-class Evaluate(BaseModel):
+@dataclass(slots=True)
+class Evaluate:
     request_id: int
     evaluator_id: int
     module_uri: str
     expr: Optional[str] = None
     module_text: Optional[str] = None
-    code: OutgoingCode
+    code: OutgoingCode = field(kw_only=True)
 
 
-class ReadResource(BaseModel):
+@dataclass(slots=True)
+class ReadResource:
     request_id: int
     evaluator_id: int
     uri: str
     code: OutgoingCode
 
 
-class ReadModule(BaseModel):
+@dataclass(slots=True)
+class ReadModule:
     request_id: int
     evaluator_id: int
     uri: str
     code: OutgoingCode
 
 
-class ListResources(BaseModel):
+@dataclass(slots=True)
+class ListResources:
     request_id: int
     evaluator_id: int
     uri: str
     code: OutgoingCode
 
 
-class ListModules(BaseModel):
+@dataclass(slots=True)
+class ListModules:
     request_id: int
     evaluator_id: int
     uri: str
     code: OutgoingCode
 
 
-class CloseEvaluator(BaseModel):
-    request_id: int
+@dataclass(slots=True)
+class CloseEvaluator:
     evaluator_id: int
     code: OutgoingCode
 
@@ -101,3 +108,53 @@ OutgoingMessage = Union[
     ListModules,
     CloseEvaluator,
 ]
+
+
+@lru_cache(maxsize=None)
+def wire_fields(cls: type) -> Tuple[Tuple[str, str], ...]:
+    """
+    The (attribute, camelCased Pkl name) pair of each field of the dataclass cls,
+    other than its message code.
+    """
+    pairs = []
+    for f in fields(cls):
+        if f.name == "code":
+            continue
+        head, *rest = f.name.split("_")
+        pairs.append((f.name, head + "".join(part.title() for part in rest)))
+    return tuple(pairs)
+
+
+def _properties(msg: Any) -> Dict[str, Any]:
+    return {
+        key: value
+        for name, key in wire_fields(type(msg))
+        if (value := getattr(msg, name)) is not None
+    }
+
+
+def encode_default(obj: Any) -> Any:
+    """
+    msgpack default hook for the values nested in outgoing messages (readers,
+    projects, enums), so they are converted as the packer reaches them.
+    """
+    if is_dataclass(obj):
+        return _properties(obj)
+    if isinstance(obj, Enum):
+        return obj.value
+    raise TypeError(f"cannot serialize {type(obj).__name__} for Pkl")
+
+
+def encode(
+    msg: "OutgoingMessage | Tuple[int, Dict[str, Any]]",
+) -> Tuple[int, Dict[str, Any]]:
+    """
+    Converts an outgoing message into its wire form, a (code, properties) pair whose
+    property names are camelCased and unset properties are left out. Nested values are
+    left to encode_default, which the packer must be configured with.
+
+    Messages that are already (code, properties) pairs are returned as they are.
+    """
+    if isinstance(msg, tuple):
+        return msg
+    return msg.code, _properties(msg)
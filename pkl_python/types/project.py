@@ -3,31 +3,31 @@ from dataclasses import dataclass
 from typing import Dict, List, Optional
 
 
-@dataclass
+@dataclass(slots=True)
 class Checksums:
     sha256: str
 
 
-@dataclass
+@dataclass(slots=True)
 class ProjectRemoteDependency:
     package_uri: str
     checksums: Checksums
 
 
-@dataclass
+@dataclass(slots=True)
 class ProjectLocalDependency:
     package_uri: str
     project_file_uri: str
     dependencies: ProjectDependencies
 
 
-@dataclass
+@dataclass(slots=True)
 class ProjectDependencies:
     local_dependencies: Dict[str, ProjectLocalDependency]
     remote_dependencies: Dict[str, ProjectRemoteDependency]
 
 
-@dataclass
+@dataclass(slots=True)
 class ProjectPackage:
     name: str
     base_uri: str
@@ -47,7 +47,7 @@ class ProjectPackage:
     uri: List[str]
 
 
-@dataclass
+@dataclass(slots=True)
 class ProjectEvaluatorSettings:
     external_properties: Dict[str, str]
     env: Dict[str, str]
@@ -59,7 +59,7 @@ class ProjectEvaluatorSettings:
     no_cache: Optional[bool] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Project:
     project_file_uri: str
     tests: List[str]
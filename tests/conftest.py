@@ -0,0 +1,10 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+
+@pytest.fixture
+def pkl_command():
+    # stub_pkl_server.py stands in for `pkl`, run by the interpreter running the tests.
+    return [sys.executable, str(Path(__file__).parent / "stub_pkl_server.py")]
@@ -0,0 +1,173 @@
+"""
+A stand-in for `pkl server` that speaks the message protocol over stdio, for testing
+the evaluator manager without a Pkl installation.
+
+Evaluate requests are answered according to their expression:
+
+    hang            never answered
+    garbage         answered with a byte that isn't valid msgpack
+    exit            the server exits
+    log             a warning is logged, then the expression is returned
+    evaluator       the evaluator's id is returned
+    env             the env the evaluator was created with is returned
+    read:URI        the resource at URI is read from the client and returned
+    module:URI      the module at URI is read from the client and returned
+    list:URI        the resources at URI are listed by the client and returned
+    listmodules:URI the modules at URI are listed by the client and returned
+
+Any other expression is returned as is, and modules named PklProject evaluate to a
+project with a single remote dependency. With --bad-version, `--version` prints
+something other than a Pkl version.
+"""
+
+import itertools
+import os
+import sys
+
+import msgpack
+
+NewEvaluator = 0x20
+NewEvaluatorResponse = 0x21
+Evaluate = 0x23
+EvaluateResponse = 0x24
+EvaluateLog = 0x25
+
+# Expression prefix -> (request code, response code) of requests made to the client.
+CLIENT_REQUESTS = {
+    "read": (0x26, 0x27),
+    "module": (0x28, 0x29),
+    "list": (0x2A, 0x2B),
+    "listmodules": (0x2C, 0x2D),
+}
+RESULT_KEYS = {
+    0x27: "contents",
+    0x29: "contents",
+    0x2B: "pathElements",
+    0x2D: "pathElements",
+}
+
+
+def pkl_object(name, module_uri, **properties):
+    return [0x1, name, module_uri, [[0x10, k, v] for k, v in properties.items()]]
+
+
+def project(project_file_uri):
+    return pkl_object(
+        "PklProject",
+        project_file_uri,
+        projectFileUri=project_file_uri,
+        tests=[0x5, []],
+        dependencies=[
+            0x3,
+            {
+                "remote": pkl_object(
+                    "RemoteDependency",
+                    "pkl:Project",
+                    uri="package://example.com/remote@1.0.0",
+                    checksums=pkl_object("Checksums", "pkl:Project", sha256="abc123"),
+                )
+            },
+        ],
+        evaluatorSettings=pkl_object(
+            "EvaluatorSettings", "pkl:EvaluatorSettings", env=[0x3, {"KEY": "value"}]
+        ),
+    )
+
+
+def main():
+    if "--version" in sys.argv:
+        if "--bad-version" in sys.argv:
+            print("not Pkl")
+        else:
+            print("Pkl 0.25.2 (Linux 6.0, native)")
+        return
+
+    out = sys.stdout.buffer
+
+    def send(code, body):
+        out.write(msgpack.packb([code, body]))
+        out.flush()
+
+    def respond(evaluate, result=None, error=None):
+        body = {
+            "requestId": evaluate["requestId"],
+            "evaluatorId": evaluate["evaluatorId"],
+        }
+        if error is not None:
+            body["error"] = error
+        else:
+            body["result"] = msgpack.packb(result)
+        send(EvaluateResponse, body)
+
+    next_request_id = itertools.count(1).__next__
+    # evaluator id -> the env it was created with.
+    envs = {}
+    # request id of a request made to the client -> the Evaluate it is for.
+    waiting = {}
+    unpacker = msgpack.Unpacker(raw=False)
+    while chunk := os.read(sys.stdin.fileno(), 1 << 16):
+        unpacker.feed(chunk)
+        for code, body in unpacker:
+            if code == NewEvaluator:
+                if (body.get("env") or {}).get("FAIL"):
+                    send(
+                        NewEvaluatorResponse,
+                        {"requestId": body["requestId"], "error": "bad options"},
+                    )
+                else:
+                    evaluator_id = 100 + body["requestId"]
+                    envs[evaluator_id] = body.get("env")
+                    send(
+                        NewEvaluatorResponse,
+                        {"requestId": body["requestId"], "evaluatorId": evaluator_id},
+                    )
+            elif code == Evaluate:
+                expr = body.get("expr") or ""
+                action, _, uri = expr.partition(":")
+                if body["moduleUri"].endswith("PklProject"):
+                    respond(body, project(body["moduleUri"]))
+                elif expr == "hang":
+                    pass
+                elif expr == "garbage":
+                    out.write(b"\xc1")
+                    out.flush()
+                elif expr == "exit":
+                    return
+                elif expr == "log":
+                    send(
+                        EvaluateLog,
+                        {
+                            "evaluatorId": body["evaluatorId"],
+                            "level": 1,
+                            "message": "careful",
+                            "frameUri": body["moduleUri"],
+                        },
+                    )
+                    respond(body, expr)
+                elif expr == "evaluator":
+                    respond(body, body["evaluatorId"])
+                elif expr == "env":
+                    respond(body, envs[body["evaluatorId"]])
+                elif action in CLIENT_REQUESTS:
+                    request_id = next_request_id()
+                    waiting[request_id] = body
+                    send(
+                        CLIENT_REQUESTS[action][0],
+                        {
+                            "requestId": request_id,
+                            "evaluatorId": body["evaluatorId"],
+                            "uri": uri,
+                        },
+                    )
+                else:
+                    respond(body, expr)
+            elif code in RESULT_KEYS:
+                evaluate = waiting.pop(body["requestId"])
+                if "error" in body:
+                    respond(evaluate, error=body["error"])
+                else:
+                    respond(evaluate, body[RESULT_KEYS[code]])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import asyncio
+import contextlib
+import os
+import threading
+
+import msgpack
+import pytest
+
+from pkl_python.evaluator import evaluator_manager
+from pkl_python.evaluator.evaluator_manager import (
+    _pkl_versions,
+    new_evaluator_manager_with_command,
+)
+from pkl_python.evaluator.evaluator_options import EvaluatorOptions
+from pkl_python.evaluator.module_source import TextSource
+from pkl_python.evaluator.reader import ModuleReader, PathElement, ResourceReader
+from pkl_python.types.errors import (
+    EvalError,
+    EvaluatorClosedError,
+    EvaluatorManagerClosedError,
+    PklError,
+)
+
+
+@contextlib.asynccontextmanager
+async def running_manager(pkl_command):
+    manager = new_evaluator_manager_with_command(pkl_command)
+    try:
+        yield manager
+    finally:
+        manager.close()
+        if manager.cmd:
+            await manager.exit_watcher
+        if manager.version_check:
+            await asyncio.gather(manager.version_check, return_exceptions=True)
+
+
+@pytest.fixture(autouse=True)
+def clear_pkl_versions():
+    _pkl_versions.clear()
+
+
+def test_get_version(pkl_command):
+    async def main():
+        async with running_manager(pkl_command) as manager:
+            assert await manager.get_version() == "0.25.2"
+
+    asyncio.run(main())
+
+
+def test_get_version_fails_with_pkl_error(pkl_command):
+    async def main():
+        async with running_manager(pkl_command + ["--bad-version"]) as manager:
+            await manager.start()
+            with pytest.raises(PklError):
+                await manager.get_version()
+
+    asyncio.run(main())
+
+
+def test_close_stops_the_version_check(pkl_command):
+    async def main():
+        async with running_manager(pkl_command) as manager:
+            await manager.start()
+            manager.close()
+            await asyncio.gather(manager.version_check, return_exceptions=True)
+            assert manager.version_check.cancelled()
+            with pytest.raises(EvaluatorManagerClosedError):
+                await manager.get_version()
+
+    asyncio.run(main())
+
+
+def test_messages_sent_together_are_written_at_once(pkl_command):
+    async def main():
+        async with running_manager(pkl_command) as manager:
+            evaluator = await manager.new_evaluator(EvaluatorOptions())
+            writes = []
+            write = manager.cmd.stdin.write
+
+            def record_write(data):
+                writes.append(bytes(data))
+                write(data)
+
+            manager.cmd.stdin.write = record_write
+            results = await asyncio.gather(
+                *(
+                    evaluator.evaluate_expression_raw(TextSource("x = 1"), f"x + {i}")
+                    for i in range(10)
+                )
+            )
+
+            assert [msgpack.unpackb(r) for r in results] == [
+                f"x + {i}" for i in range(10)
+            ]
+            assert len(writes) == 1
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("expr", ["exit", "garbage"])
+def test_pending_evaluations_fail_when_pkl_goes_away(pkl_command, expr):
+    # "exit" makes the server exit, "garbage" makes it send output that can't be
+    # unpacked, which has the manager stop it.
+    async def main():
+        async with running_manager(pkl_command) as manager:
+            evaluator = await manager.new_evaluator(EvaluatorOptions())
+            with pytest.raises(EvaluatorClosedError):
+                await evaluator.evaluate_expression_raw(TextSource("x = 1"), expr)
+            await manager.exit_watcher
+            assert manager.closed
+            assert evaluator.closed
+
+    asyncio.run(main())
+
+
+def test_pending_new_evaluator_fails_when_pkl_exits(pkl_command):
+    async def main():
+        async with running_manager(pkl_command) as manager:
+            await manager.start()
+            pending = asyncio.create_task(manager.new_evaluator(EvaluatorOptions()))
+            await asyncio.sleep(0)
+            # Pkl is gone before the CreateEvaluator request is ever written.
+            manager.cmd.kill()
+            with pytest.raises(PklError, match="Pkl process exited"):
+                await pending
+
+    asyncio.run(main())
+
+
+def test_closing_an_evaluator_fails_its_pending_evaluations(pkl_command):
+    async def main():
+        async with running_manager(pkl_command) as manager:
+            evaluator = await manager.new_evaluator(EvaluatorOptions())
+            pending = asyncio.create_task(
+                evaluator.evaluate_expression_raw(TextSource("x = 1"), "hang")
+            )
+            await asyncio.sleep(0)
+            evaluator.close()
+            with pytest.raises(EvaluatorClosedError):
+                await pending
+            assert evaluator.evaluator_id not in manager.evaluators
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("started", [False, True])
+def test_closed_manager_refuses_new_evaluators(pkl_command, started):
+    async def main():
+        async with running_manager(pkl_command) as manager:
+            if started:
+                await manager.new_evaluator(EvaluatorOptions())
+            manager.close()
+            with pytest.raises(EvaluatorManagerClosedError):
+                await asyncio.wait_for(manager.new_evaluator(EvaluatorOptions()), 5)
+
+    asyncio.run(main())
+
+
+class BlockingResources(ResourceReader):
+    def __init__(self):
+        super().__init__("blocking", is_globbable=True, has_hierarchical_uris=True)
+        self.threads = []
+
+    def read(self, url):
+        self.threads.append(threading.current_thread())
+        return url.encode()
+
+    def list_elements(self, url):
+        self.threads.append(threading.current_thread())
+        return [PathElement("a.txt", False)]
+
+
+class AsyncModules(ModuleReader):
+    def __init__(self):
+        super().__init__(
+            "async", is_globbable=True, has_hierarchical_uris=True, is_local=True
+        )
+        self.threads = []
+
+    async def read(self, url):
+        self.threads.append(threading.current_thread())
+        return f"// {url}"
+
+    async def list_elements(self, url):
+        self.threads.append(threading.current_thread())
+        return [PathElement("dir", True)]
+
+
+def test_readers_are_called_for_pkl_requests(pkl_command):
+    resources = BlockingResources()
+    modules = AsyncModules()
+
+    async def main():
+        async with running_manager(pkl_command) as manager:
+            evaluator = await manager.new_evaluator(
+                EvaluatorOptions(resource_readers=[resources], module_readers=[modules])
+            )
+
+            async def evaluate(expr):
+                source = TextSource("x = 1")
+                return msgpack.unpackb(
+                    await evaluator.evaluate_expression_raw(source, expr)
+                )
+
+            assert await evaluate("read:blocking:/a.txt") == b"blocking:/a.txt"
+            assert await evaluate("list:blocking:/") == [
+                {"name": "a.txt", "isDirectory": False}
+            ]
+            assert await evaluate("module:async:/a.pkl") == "// async:/a.pkl"
+            assert await evaluate("listmodules:async:/") == [
+                {"name": "dir", "isDirectory": True}
+            ]
+            with pytest.raises(EvalError, match="No resource reader found for scheme"):
+                await evaluate("read:async:/a.txt")
+
+    asyncio.run(main())
+
+    # Blocking readers run in the executor, coroutine readers on the event loop.
+    main_thread = threading.main_thread()
+    assert len(resources.threads) == 2
+    assert all(thread is not main_thread for thread in resources.threads)
+    assert modules.threads == [main_thread, main_thread]
+
+
+def test_messages_reach_the_evaluator_they_are_for(pkl_command, caplog):
+    async def main():
+        async with running_manager(pkl_command) as manager:
+            first = await manager.new_evaluator(EvaluatorOptions())
+            second = await manager.new_evaluator(EvaluatorOptions())
+            source = TextSource("x = 1")
+            results = await asyncio.gather(
+                first.evaluate_expression_raw(source, "evaluator"),
+                second.evaluate_expression_raw(source, "evaluator"),
+            )
+            assert [msgpack.unpackb(r) for r in results] == [
+                first.evaluator_id,
+                second.evaluator_id,
+            ]
+
+            first.close()
+            assert first.evaluator_id not in manager.evaluator_handlers
+            # Messages for evaluators that are gone are dropped.
+            manager.receive([0x24, {"evaluatorId": first.evaluator_id, "requestId": 1}])
+            assert "received unknown evaluator id" in caplog.text
+            assert await second.evaluate_expression_raw(source, "evaluator")
+
+    asyncio.run(main())
+
+
+def test_project_is_reloaded_only_when_it_changes(pkl_command, tmp_path, monkeypatch):
+    project_file = tmp_path / "PklProject"
+    project_file.write_text('amends "pkl:Project"')
+    loads = []
+    load = evaluator_manager.load_project_from_evaluator
+
+    async def counting_load(ev, path):
+        loads.append(path)
+        return await load(ev, path)
+
+    monkeypatch.setattr(evaluator_manager, "load_project_from_evaluator", counting_load)
+
+    async def main():
+        async with running_manager(pkl_command) as manager:
+            first = await manager.new_project_evaluator(
+                str(tmp_path), EvaluatorOptions()
+            )
+            second = await manager.new_project_evaluator(
+                str(tmp_path), EvaluatorOptions(env={"OTHER": "1"})
+            )
+            assert len(loads) == 1
+            # The project's settings apply unless overridden by the caller.
+            source = TextSource("x = 1")
+            env = await first.evaluate_expression_raw(source, "env")
+            assert msgpack.unpackb(env) == {"KEY": "value"}
+            env = await second.evaluate_expression_raw(source, "env")
+            assert msgpack.unpackb(env) == {"OTHER": "1"}
+
+            stat = project_file.stat()
+            os.utime(project_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+            await manager.new_project_evaluator(str(tmp_path), EvaluatorOptions())
+            assert loads == [str(project_file), str(project_file)]
+
+    asyncio.run(main())
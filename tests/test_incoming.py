@@ -0,0 +1,88 @@
+import pytest
+
+from pkl_python.types import codes
+from pkl_python.types.incoming import (
+    CreateEvaluatorResponse,
+    EvaluateResponse,
+    ListModules,
+    ListResources,
+    Log,
+    ReadModule,
+    ReadResource,
+    decode,
+)
+
+
+@pytest.mark.parametrize(
+    "incoming, expected",
+    [
+        (
+            (codes.NewEvaluatorResponse, {"requestId": 1, "evaluatorId": 2}),
+            CreateEvaluatorResponse(request_id=1, evaluator_id=2),
+        ),
+        (
+            (codes.NewEvaluatorResponse, {"requestId": 1, "error": "bad options"}),
+            CreateEvaluatorResponse(request_id=1, error="bad options"),
+        ),
+        (
+            (
+                codes.EvaluateResponse,
+                {"requestId": 3, "evaluatorId": 2, "result": b"\x01"},
+            ),
+            EvaluateResponse(request_id=3, evaluator_id=2, result=b"\x01"),
+        ),
+        (
+            (
+                codes.EvaluateResponse,
+                {"requestId": 3, "evaluatorId": 2, "error": "oops"},
+            ),
+            EvaluateResponse(request_id=3, evaluator_id=2, error="oops"),
+        ),
+        (
+            (
+                codes.EvaluateLog,
+                {
+                    "evaluatorId": 2,
+                    "level": 1,
+                    "message": "careful",
+                    "frameUri": "repl:text",
+                },
+            ),
+            Log(evaluator_id=2, level=1, message="careful", frame_uri="repl:text"),
+        ),
+        (
+            (codes.EvaluateRead, {"requestId": 4, "evaluatorId": 2, "uri": "env:HOME"}),
+            ReadResource(request_id=4, evaluator_id=2, uri="env:HOME"),
+        ),
+        (
+            (
+                codes.EvaluateReadModule,
+                {"requestId": 5, "evaluatorId": 2, "uri": "custom:mod.pkl"},
+            ),
+            ReadModule(request_id=5, evaluator_id=2, uri="custom:mod.pkl"),
+        ),
+        (
+            (
+                codes.ListResourcesRequest,
+                {"requestId": 6, "evaluatorId": 2, "uri": "env:"},
+            ),
+            ListResources(request_id=6, evaluator_id=2, uri="env:"),
+        ),
+        (
+            (
+                codes.ListModulesRequest,
+                {"requestId": 7, "evaluatorId": 2, "uri": "custom:/"},
+            ),
+            ListModules(request_id=7, evaluator_id=2, uri="custom:/"),
+        ),
+    ],
+)
+def test_decode(incoming, expected):
+    decoded = decode(incoming)
+    assert decoded == expected
+    assert decoded.code == incoming[0]
+
+
+def test_decode_unknown_code():
+    with pytest.raises(ValueError):
+        decode((0x7F, {}))
@@ -0,0 +1,121 @@
+import msgpack
+import pytest
+
+from pkl_python.evaluator.evaluator_options import OutputFormat
+from pkl_python.evaluator.reader import PathElement
+from pkl_python.types import codes
+from pkl_python.types.outgoing import (
+    Checksums,
+    CloseEvaluator,
+    CreateEvaluator,
+    Evaluate,
+    ModuleReader,
+    ProjectOrDependency,
+    ResourceReader,
+    encode,
+    encode_default,
+)
+
+
+def roundtrip(msg):
+    return msgpack.unpackb(msgpack.packb(encode(msg), default=encode_default))
+
+
+def test_create_evaluator_with_readers_and_project():
+    msg = CreateEvaluator(
+        request_id=1,
+        client_resource_readers=[
+            ResourceReader(scheme="env", has_hierarchical_uris=False, is_globbable=True)
+        ],
+        client_module_readers=[
+            ModuleReader(
+                scheme="custom",
+                has_hierarchical_uris=True,
+                is_globbable=False,
+                is_local=True,
+            )
+        ],
+        output_format="json",
+        project=ProjectOrDependency(
+            project_file_uri="file:///project/PklProject",
+            dependencies={
+                "remote": ProjectOrDependency(
+                    package_uri="package://example.com/remote@1.0.0",
+                    type="remote",
+                    checksums=Checksums(checksums="abc123"),
+                ),
+            },
+        ),
+        code=codes.NewEvaluator,
+    )
+
+    assert roundtrip(msg) == [
+        codes.NewEvaluator,
+        {
+            "requestId": 1,
+            "clientResourceReaders": [
+                {"scheme": "env", "hasHierarchicalUris": False, "isGlobbable": True}
+            ],
+            "clientModuleReaders": [
+                {
+                    "scheme": "custom",
+                    "hasHierarchicalUris": True,
+                    "isGlobbable": False,
+                    "isLocal": True,
+                }
+            ],
+            "outputFormat": "json",
+            "project": {
+                "projectFileUri": "file:///project/PklProject",
+                "dependencies": {
+                    "remote": {
+                        "packageUri": "package://example.com/remote@1.0.0",
+                        "type": "remote",
+                        "checksums": {"checksums": "abc123"},
+                    }
+                },
+            },
+        },
+    ]
+
+
+def test_unset_properties_are_left_out():
+    msg = Evaluate(
+        request_id=2, evaluator_id=3, module_uri="repl:text", code=codes.Evaluate
+    )
+    assert encode(msg) == (
+        codes.Evaluate,
+        {"requestId": 2, "evaluatorId": 3, "moduleUri": "repl:text"},
+    )
+
+
+def test_close_evaluator():
+    msg = CloseEvaluator(evaluator_id=4, code=codes.CloseEvaluator)
+    assert encode(msg) == (codes.CloseEvaluator, {"evaluatorId": 4})
+
+
+def test_encoded_messages_are_passed_through():
+    msg = (codes.EvaluateReadResponse, {"requestId": 5, "contents": b"data"})
+    assert encode(msg) is msg
+
+
+def test_nested_path_elements_and_enums():
+    msg = (
+        codes.ListResourcesResponse,
+        {
+            "pathElements": [PathElement(name="bar.txt", is_directory=False)],
+            "outputFormat": OutputFormat.PCF,
+        },
+    )
+    assert roundtrip(msg) == [
+        codes.ListResourcesResponse,
+        {
+            "pathElements": [{"name": "bar.txt", "isDirectory": False}],
+            "outputFormat": "pcf",
+        },
+    ]
+
+
+def test_encode_default_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        encode_default(object())
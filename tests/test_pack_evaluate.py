@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import msgpack
+import pytest
+
+from pkl_python.evaluator import evaluator
+from pkl_python.evaluator.evaluator import EvaluatorImpl
+from pkl_python.evaluator.module_source import FileSource, TextSource
+from pkl_python.types import codes
+from pkl_python.types.outgoing import Evaluate, encode, encode_default
+
+
+def new_evaluator():
+    manager = SimpleNamespace(encoder=msgpack.Packer(default=encode_default))
+    return EvaluatorImpl(7, manager)
+
+
+@pytest.mark.parametrize(
+    "source, expr",
+    [
+        (TextSource("x = 1"), "x"),
+        (TextSource("x = 1"), None),
+        (FileSource("/project/mod.pkl"), "output.text"),
+        (FileSource("/project/mod.pkl"), None),
+    ],
+)
+def test_packed_evaluate_matches_encode(source, expr):
+    ev = new_evaluator()
+    expected = Evaluate(
+        request_id=3,
+        evaluator_id=7,
+        module_uri=source.uri,
+        expr=expr,
+        module_text=source.contents,
+        code=codes.Evaluate,
+    )
+    expected = msgpack.unpackb(msgpack.packb(encode(expected), default=encode_default))
+
+    # The second call is served from the prefix cache.
+    for _ in range(2):
+        packed = b"".join(ev._pack_evaluate(3, source, expr))
+        assert msgpack.unpackb(packed) == expected
+
+
+def test_prefix_cache_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(evaluator, "EVALUATE_PREFIX_CACHE_SIZE", 2)
+    ev = new_evaluator()
+    a, b, c = (TextSource(text) for text in ("a = 1", "b = 1", "c = 1"))
+
+    ev._pack_evaluate(1, a, None)
+    ev._pack_evaluate(2, b, None)
+    # Using a again makes b the least recently used.
+    ev._pack_evaluate(3, a, None)
+    ev._pack_evaluate(4, c, None)
+
+    assert list(ev._evaluate_prefix_cache) == [
+        ("repl:text", "a = 1"),
+        ("repl:text", "c = 1"),
+    ]
@@ -0,0 +1,112 @@
+from pkl_python.evaluator.project import project_from_value
+from pkl_python.types.project import (
+    Checksums,
+    Project,
+    ProjectDependencies,
+    ProjectEvaluatorSettings,
+    ProjectLocalDependency,
+    ProjectRemoteDependency,
+)
+
+
+def test_minimal_project():
+    project = project_from_value({"projectFileUri": "file:///project/PklProject"})
+    assert project == Project(
+        project_file_uri="file:///project/PklProject",
+        tests=[],
+        dependencies=ProjectDependencies({}, {}),
+    )
+
+
+def test_package_and_evaluator_settings():
+    project = project_from_value(
+        {
+            "projectFileUri": "file:///project/PklProject",
+            "tests": ["tests/a.pkl"],
+            "package": {
+                "name": "example",
+                "baseUri": "package://example.com/example",
+                "version": "1.0.0",
+                "packageZipUrl": "https://example.com/example@1.0.0.zip",
+                "sourceCodeUrlScheme": "https://example.com/src%{path}",
+                "apiTests": [],
+                "uri": "package://example.com/example@1.0.0",
+            },
+            "evaluatorSettings": {
+                "externalProperties": {"key": "value"},
+                "modulePath": ["modules"],
+                "noCache": True,
+            },
+        }
+    )
+
+    assert project.tests == ["tests/a.pkl"]
+    assert project.package.base_uri == "package://example.com/example"
+    assert project.package.package_zip_url == "https://example.com/example@1.0.0.zip"
+    assert project.package.source_code_url_scheme == "https://example.com/src%{path}"
+    assert project.package.api_tests == []
+    # Properties missing from the value are left unset.
+    assert project.package.description is None
+    assert project.evaluator_settings == ProjectEvaluatorSettings(
+        external_properties={"key": "value"},
+        env=None,
+        allowed_modules=None,
+        allowed_resources=None,
+        module_path=["modules"],
+        module_cache_dir=None,
+        root_dir=None,
+        no_cache=True,
+    )
+
+
+def test_local_and_remote_dependencies():
+    project = project_from_value(
+        {
+            "projectFileUri": "file:///project/PklProject",
+            "dependencies": {
+                "remote": {
+                    "uri": "package://example.com/remote@1.0.0",
+                    "checksums": {"sha256": "abc123"},
+                },
+                "unchecked": {"uri": "package://example.com/unchecked@2.0.0"},
+                "local": {
+                    "projectFileUri": "file:///local/PklProject",
+                    "package": {"uri": "package://example.com/local@0.1.0"},
+                    "dependencies": {
+                        "nested": {
+                            "uri": "package://example.com/nested@3.0.0",
+                            "checksums": {"sha256": "def456"},
+                        }
+                    },
+                },
+            },
+        }
+    )
+
+    assert project.dependencies == ProjectDependencies(
+        local_dependencies={
+            "local": ProjectLocalDependency(
+                package_uri="package://example.com/local@0.1.0",
+                project_file_uri="file:///local/PklProject",
+                dependencies=ProjectDependencies(
+                    local_dependencies={},
+                    remote_dependencies={
+                        "nested": ProjectRemoteDependency(
+                            package_uri="package://example.com/nested@3.0.0",
+                            checksums=Checksums("def456"),
+                        )
+                    },
+                ),
+            )
+        },
+        remote_dependencies={
+            "remote": ProjectRemoteDependency(
+                package_uri="package://example.com/remote@1.0.0",
+                checksums=Checksums("abc123"),
+            ),
+            "unchecked": ProjectRemoteDependency(
+                package_uri="package://example.com/unchecked@2.0.0",
+                checksums=None,
+            ),
+        },
+    )
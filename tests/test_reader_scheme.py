@@ -0,0 +1,19 @@
+import pytest
+
+from pkl_python.evaluator.evaluator import _scheme_of
+
+
+@pytest.mark.parametrize(
+    "uri, scheme",
+    [
+        ("env:HOME", "env"),
+        ("file:///foo/bar.txt", "file"),
+        ("package://example.com/pkg@1.0.0#/mod.pkl", "package"),
+        ("custom:a:b", "custom"),
+        ("no-scheme", ""),
+        (":empty", ""),
+        ("", ""),
+    ],
+)
+def test_scheme_of(uri, scheme):
+    assert _scheme_of(uri) == scheme